@@ -27,27 +27,49 @@ TODO:
 """
 
 import argparse
+import atexit
 import csv
+import functools
 import hmac
+import io
+import json
+import logging
+import operator
 import os
+import queue
+import random
 import sys
 import secrets
+import socket
 import string
+import threading
 import time
 import tomllib
 import smtplib
 import ssl
 import hashlib
+import html
 import re
 import requests
-from dataclasses import dataclass, asdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields as dataclass_fields
 from datetime import datetime
+from email import policy as email_policy
 from email.message import EmailMessage
 from email.utils import formataddr
 from typing import Final, Any, Optional, List, Dict
 
 import google.auth
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+# orjson é opcional: (de)serialização JSON mais rápida quando instalado
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 
 # --- 1. CONFIGURAÇÃO E CONSTANTES ---
@@ -81,21 +103,48 @@ CREDENTIALS_PATH: Final[str] = os.path.join(CONFIG_DIR, CREDENTIALS_FILE_NAME)
 SMTP_HOST: Final[str] = "smtp.hostinger.com"
 SMTP_PORT: Final[int] = 465
 SMTP_USER: Final[str] = "comissaoeleitoral@agesp.org.br"
+# Rotaciona a conexão SMTP persistente após N mensagens (limite por conexão
+# de provedores; padrão conservador)
+SMTP_MAX_MSGS_PER_CONNECTION: Final[int] = 100
+# Só vale a pena pagar um NOOP de health check se a conexão ficou ociosa
+# (servidores derrubam sessões paradas; em ritmo de envio ela está viva)
+SMTP_IDLE_NOOP_SECONDS: Final[float] = 30.0
+# Workers de envio em paralelo; cada um mantém a PRÓPRIA conexão SMTP
+# persistente (abaixo do teto de conexões simultâneas dos provedores)
+SMTP_POOL_SIZE: Final[int] = 4
+# Intervalo-alvo entre envios (ritmo p/ cotas de provedor SMTP e Sheets)
+EMAIL_SEND_INTERVAL_SECONDS: Final[float] = 2.0
+# A cada N eleitores o COMMIT (Etapa 2) é descarregado em disco. O registro
+# PENDENTE (Etapa 1) continua sendo salvo por eleitor — é ele que garante a
+# auditoria; diferir só o commit nunca perde informação de risco.
+ENVIADOS_FLUSH_INTERVAL: Final[int] = 50
+
+# Contexto TLS compartilhado: carrega o bundle de CAs do disco UMA vez
+# por execução (SSLContext é seguro para reuso entre conexões)
+SSL_CONTEXT: Final[ssl.SSLContext] = ssl.create_default_context()
+SSL_CONTEXT.minimum_version = ssl.TLSVersion.TLSv1_2
 FROM_NAME: Final[str] = "Comissão Eleitoral AGESP"
 SUBJECT: Final[str]   = "Eleições AGESP 2025 – Suas credenciais para votação"
+# Header From pronto (formataddr faz encode RFC 2047 do display name com
+# acentos — não precisa refazer isso por mensagem)
+FROM_HEADER: Final[str] = formataddr((FROM_NAME, SMTP_USER))
 
 # Google Forms
 BASE_FORM_URL: Final[str] = "https://forms.gle/KxS5SK5xcv7RPhew5"
 
 # Datas da Eleição
-DATA_INICIO_VOTACAO: Final[str] = "09/12/2025" 
+DATA_INICIO_VOTACAO: Final[str] = "09/12/2025"
 DATA_FIM_VOTACAO: Final[str] = "10/12/2025"
+ANO_ELEICAO: Final[int] = datetime.now().year  # Constante por execução
 
 # Constantes de integração com GitHub
 GITHUB_OWNER = "oiceberg"
 GITHUB_REPO = "eleicoes-eletronicas"
 GITHUB_BRANCH = "main"
 
+# Cache local de ETags do GitHub (GETs condicionais na auditoria)
+GITHUB_CACHE_FILEPATH: Final[str] = 'data/.github_cache.json'
+
 # Mapeamento de quais arquivos locais (usando o display name) devem ser comparados com o GitHub
 GITHUB_FILES_TO_COMPARE = [
     'src/eleicoes.py',
@@ -112,10 +161,21 @@ except FileNotFoundError:
     print("[ERRO FATAL] Arquivo 'config/env.toml' não encontrado.")
     exit(1)
 
+# Resolvidos UMA vez na importação (os lookups por chamada somem do loop);
+# a ausência da MASTER_KEY continua sendo acusada no ponto de uso
+MASTER_KEY: Final[Optional[str]] = ENV.get('MASTER_KEY')
+os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = CREDENTIALS_PATH
+
+
+# Formata o timestamp no caminho C (time.strftime), sem construir um objeto
+# datetime por chamada — chamado várias vezes por eleitor via log_event.
+def current_timestamp() -> str:
+    """Timestamp atual no formato DATE_FORMAT (fast path via time.strftime)."""
+    return time.strftime(DATE_FORMAT, time.localtime())
 
 # --- 2. MODELOS DE DADOS ---
 
-@dataclass
+@dataclass(slots=True)
 class LogEntry:
     timestamp: str
     is_production: bool
@@ -124,12 +184,12 @@ class LogEntry:
     user_id: str
     message: str
 
-@dataclass
+@dataclass(slots=True)
 class Eleitor:
     nome: str
     email: str
 
-@dataclass
+@dataclass(slots=True)
 class RegistroEnvio:
     timestamp: str
     email: str
@@ -140,37 +200,131 @@ class RegistroEnvio:
     is_delivered: bool
     is_production: bool
 
-@dataclass
+@dataclass(slots=True)
 class KeyPair:
     user_id: str
     priv_key: str
     pub_key: str
 
+# Ordem canônica das colunas do CSV de enviados + extrator de valores em C
+# (attrgetter), usados pela serialização em lote de save_enviados_atomically
+_REGISTRO_FIELDS: Final[tuple] = tuple(f.name for f in dataclass_fields(RegistroEnvio))
+_REGISTRO_VALUES = operator.attrgetter(*_REGISTRO_FIELDS)
+
 class Tee:
     """
     Redireciona a saída (stdout) para múltiplos fluxos (terminal e arquivo).
+
+    A escrita no arquivo acontece em uma thread de fundo alimentada por uma
+    fila limitada: a latência de disco (flush do filesystem) deixa de
+    bloquear o loop principal de envio. A fila é drenada em lotes e o
+    fechamento aguarda a drenagem completa via sentinela.
     """
+
+    _SENTINEL = None  # Marca o fim da fila no close()
+
     def __init__(self, filename, mode="a"):
         self.file = open(filename, mode, encoding=ENCODING)
         self.stdout = sys.stdout
+        self.queue: queue.Queue = queue.Queue(maxsize=1000)
+        self._writer_thread = threading.Thread(target=self._drain, daemon=True)
+        self._writer_thread.start()
+
+    def _drain(self):
+        """Consome a fila em lotes e escreve no arquivo (thread de fundo)."""
+        while True:
+            data = self.queue.get()
+            if data is self._SENTINEL:
+                return
+            # Junta tudo que já está na fila em UMA escrita
+            buf = [data]
+            try:
+                while True:
+                    nxt = self.queue.get_nowait()
+                    if nxt is self._SENTINEL:
+                        self.file.write("".join(buf))
+                        self.file.flush()
+                        return
+                    buf.append(nxt)
+            except queue.Empty:
+                pass
+            self.file.write("".join(buf))
+            self.file.flush()
 
     def write(self, data):
-        # 1. Escreve no arquivo
-        self.file.write(data)
-        self.file.flush() # Força a escrita imediata
-        
+        # 1. Enfileira para o arquivo (fila limitada; não bloqueia em disco)
+        self.queue.put(data)
+
         # 2. Escreve no terminal
         self.stdout.write(data)
 
     def flush(self):
-        # Garante que ambos os fluxos sejam liberados
-        self.file.flush()
+        # Libera o terminal; o arquivo é drenado pela thread de fundo
         self.stdout.flush()
 
     def close(self):
-        # Fecha apenas o arquivo (não o stdout original)
+        # Sinaliza o fim, aguarda a drenagem e fecha apenas o arquivo
+        self.queue.put(self._SENTINEL)
+        self._writer_thread.join(timeout=5)
         self.file.close()
 
+class TokenBucket:
+    """
+    Limitador de vazão (em média um envio a cada `interval` segundos),
+    com capacidade de rajada.
+
+    Tokens acumulam durante períodos lentos (até `burst`): o tempo gasto
+    num envio demorado vira crédito, e os próximos envios saem sem espera
+    até o balde esvaziar — a taxa MÉDIA continua limitada, ao contrário
+    de um time.sleep incondicional que impõe o pior caso a cada envio.
+    """
+    def __init__(self, interval_seconds: float, burst: int = 1):
+        self.interval = interval_seconds
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)  # Começa cheio: a largada é imediata
+        self.last_refill = time.monotonic()
+        # acquire() pode ser chamado por múltiplos workers do pool SMTP
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(float(self.burst),
+                          self.tokens + (now - self.last_refill) / self.interval)
+        self.last_refill = now
+
+    def acquire(self) -> None:
+        """Bloqueia até haver um token (antes da ação, nunca depois)."""
+        with self._lock:
+            self._refill()
+            if self.tokens < 1.0:
+                time.sleep((1.0 - self.tokens) * self.interval)
+                self._refill()
+            self.tokens -= 1.0
+
+class BatchStats:
+    """
+    Contadores de tentativas/falhas de envio do lote (thread-safe).
+
+    Funciona como disjuntor: com pelo menos 30 tentativas e >= 1/3 de
+    falhas, o provedor provavelmente está rejeitando tudo (credencial
+    errada, IP bloqueado, cota estourada) — os 2/3 restantes tendem a
+    falhar também e insistir só queima o orçamento de ritmo.
+    """
+    def __init__(self):
+        self.attempts = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self.attempts += 1
+            if not success:
+                self.failures += 1
+
+    def should_abort(self) -> bool:
+        with self._lock:
+            return self.attempts >= 30 and self.failures * 3 >= self.attempts
+
 # --- 3. SERVIÇOS EXTERNOS (GOOGLE SHEETS) ---
 
 class GoogleSheetsService:
@@ -178,20 +332,108 @@ class GoogleSheetsService:
 
     def __init__(self, spreadsheet_id: str):
         self.spreadsheet_id = spreadsheet_id
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = CREDENTIALS_PATH
+        # GOOGLE_APPLICATION_CREDENTIALS é definido no import do módulo
         creds, _ = google.auth.default()
-        self.service = build("sheets", "v4", credentials=creds)
+        # Um único client para TODAS as RPCs: o transporte httplib2
+        # subjacente mantém a conexão TCP/TLS viva entre as chamadas.
+        # static_discovery evita baixar o discovery document da API
+        # (um round-trip HTTPS a menos na inicialização).
+        self.service = build(
+            "sheets", "v4",
+            credentials=creds,
+            cache_discovery=False,
+            static_discovery=True
+        )
+        # Índice em memória user_id -> linhas (carregado sob demanda):
+        # evita um values.get por chamada de invalidate_old_key.
+        self._rows_by_user: Optional[Dict[str, List[int]]] = None
+        self._inactive_rows: set = set()
+        self._num_rows = 0
+        # Protege a construção do índice: o prefetch (thread) e o worker
+        # de finalização podem pedir o índice ao mesmo tempo
+        self._index_lock = threading.Lock()
+
+    def _execute(self, request):
+        """
+        Executa uma request da API tratando cota/indisponibilidade
+        (HTTP 429/503) com backoff exponencial de jitter total, em vez de
+        delays fixos espalhados pelo fluxo. Outros erros propagam
+        imediatamente.
+        """
+        for attempt in range(5):
+            try:
+                return request.execute()
+            except HttpError as e:
+                status = e.resp.status if e.resp is not None else None
+                if status not in (429, 503) or attempt == 4:
+                    raise
+                # Jitter total: espera uniforme em [0, teto exponencial) —
+                # clientes que estouraram a cota juntos não voltam a bater
+                # na API em sincronia (o backoff determinístico recria o
+                # pico que causou o 429)
+                delay = random.uniform(0, min(30.0, 2.0 ** attempt))
+                print(f"[AVISO API] HTTP {status} — aguardando {delay:.1f}s antes de repetir...")
+                time.sleep(delay)
+
+    def _load_user_row_index(self) -> None:
+        """
+        Carrega a aba de credenciais UMA vez e constrói o índice
+        user_id -> número(s) de linha, além do conjunto de linhas já
+        desativadas. Chamadas subsequentes de invalidação viram lookups
+        O(1) sem round-trip de leitura.
+        """
+        with self._index_lock:
+            self._load_user_row_index_locked()
+
+    def _load_user_row_index_locked(self) -> None:
+        if self._rows_by_user is not None:
+            return
+        # O índice só precisa de A (user_id) e C (is_active): ler A:C em vez
+        # de A:F corta metade do payload; majorDimension=COLUMNS entrega as
+        # colunas já separadas, sem row padding
+        result = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f'{SHEET_NAME_PUB_KEY}!A:C',
+            majorDimension='COLUMNS'
+        ))
+        values = result.get('values', [])
+        col_user_id = values[0] if values else []
+        col_is_active = values[2] if len(values) > 2 else []
+
+        self._rows_by_user = {}
+        self._num_rows = len(col_user_id)
+        for i, cell in enumerate(col_user_id):
+            row_index = i + 1
+            if row_index == 1:
+                continue
+            user_id = str(cell).strip()
+            if not user_id:
+                continue
+            self._rows_by_user.setdefault(user_id, []).append(row_index)
+            if i < len(col_is_active) and str(col_is_active[i]).strip().upper() == 'FALSE':
+                self._inactive_rows.add(row_index)
+
+    def prefetch_row_index(self) -> None:
+        """
+        Pré-carrega o índice user_id -> linha em segundo plano (ex: em
+        paralelo com o envio SMTP). Erros são ignorados aqui: a invalidação
+        refaz a tentativa e trata a falha no caminho normal.
+        """
+        try:
+            self._load_user_row_index()
+        except Exception:
+            pass
 
     def write_flag_to_cell(self, cell_range: str, value: str) -> None:
         """Escreve um valor na célula flag para acionar o Apps Script via gatilho OnEdit."""
         try:
             body = {'values': [[value]]}
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.spreadsheet_id, 
+            self._execute(self.service.spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
                 range=cell_range,
-                valueInputOption='RAW', 
+                valueInputOption='RAW',
                 body=body
-            ).execute()
+            ))
         except Exception as e:
             print(f"[ERRO SHEETS] Falha ao escrever flag na célula {cell_range}: {e}")
             raise
@@ -199,19 +441,42 @@ class GoogleSheetsService:
     def append_row(self, sheet_name: str, values: list) -> None:
         """Insere uma nova linha na planilha."""
         try:
-            self.service.spreadsheets().values().append(
+            self._execute(self.service.spreadsheets().values().append(
                 spreadsheetId=self.spreadsheet_id,
                 range=f'{sheet_name}!A:F',
                 valueInputOption='RAW',
                 insertDataOption='INSERT_ROWS',
                 body={'values': [values]}
-            ).execute()
+            ))
         except Exception as e:
             raise Exception(f"Falha na escrita da linha no Sheets: {e}")
 
+        # Mantém o índice de linhas coerente sem refazer a leitura
+        if sheet_name == SHEET_NAME_PUB_KEY and self._rows_by_user is not None and values:
+            self._num_rows += 1
+            new_user_id = str(values[0]).strip()
+            self._rows_by_user.setdefault(new_user_id, []).append(self._num_rows)
+
+    def batch_write(self, updates: List[Dict[str, Any]]) -> None:
+        """
+        Escreve múltiplos intervalos em UMA única chamada à API
+        (values.batchUpdate). Cada item de `updates` é um dict no formato
+        {'range': 'Aba!A1', 'values': [[...]]}. Reduz N round-trips HTTPS
+        (e a pressão de cota) a 1.
+        """
+        if not updates:
+            return
+        try:
+            self._execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'valueInputOption': 'RAW', 'data': updates}
+            ))
+        except Exception as e:
+            raise Exception(f"Falha na escrita em lote no Sheets: {e}")
+
     def update_cell(self, range_name: str, value: Any) -> None:
         body = {'values': [[value]]}
-        (
+        self._execute(
             self.service.spreadsheets()
             .values()
             .update(
@@ -220,7 +485,6 @@ class GoogleSheetsService:
                 valueInputOption='RAW',
                 body=body
             )
-            .execute()
         )
 
     def invalidate_old_key(self, user_id: str) -> bool:
@@ -229,94 +493,126 @@ class GoogleSheetsService:
         Retorna True se houve PELO MENOS UMA escrita.
         """
         try:
-            # 1. Busca todas as chaves (API Read)
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id, range=RANGE_PUB_KEY
-            ).execute()
-            values = result.get('values', [])
+            # 1. Garante o índice user_id -> linhas (UMA leitura por execução)
+            self._load_user_row_index()
         except Exception as e:
             print(f"[ERRO API] Falha na leitura para invalidação: {e}")
             return False
 
-        writes_performed = False
-        
-        # 2. Itera sobre TODAS as linhas
-        for i, row in enumerate(values):
-            row_index = i + 1
-            if row_index == 1 or len(row) < 3: continue 
+        # 2. Coleta TODAS as linhas ainda ativas do usuário (lookup O(1))
+        rows_to_invalidate = []
+        for row_index in self._rows_by_user.get(user_id, []):
 
-            current_id = str(row[0]).strip()
-            is_active_str = str(row[2]).strip().upper() 
-            
-            if current_id == user_id:
-                
-                # Check Crítico: Se JÁ está desativada, apenas avisa e segue
-                if is_active_str == 'FALSE':
-                    print(f"[PULAR] Chave antiga {user_id} (linha {row_index}) já desativada.")
-                    continue 
+            # Check Crítico: Se JÁ está desativada, apenas avisa e segue
+            if row_index in self._inactive_rows:
+                print(f"[PULAR] Chave antiga {user_id} (linha {row_index}) já desativada.")
+                continue
 
-                # 3. Se encontrada e ATIVA, realiza a invalidação (Duas chamadas API Write)
-                now_str = datetime.now().strftime(DATE_FORMAT)
+            rows_to_invalidate.append(row_index)
 
-                try:
-                    # Update C: is_active = FALSE
-                    self.service.spreadsheets().values().update(
-                        spreadsheetId=self.spreadsheet_id, 
-                        range=f'{SHEET_NAME_PUB_KEY}!C{row_index}', 
-                        valueInputOption='RAW', 
-                        body={'values': [['FALSE']]}
-                    ).execute()
-                    
-                    # Update F: t_desativacao = Timestamp
-                    self.service.spreadsheets().values().update(
-                        spreadsheetId=self.spreadsheet_id, 
-                        range=f'{SHEET_NAME_PUB_KEY}!F{row_index}', 
-                        valueInputOption='RAW', 
-                        body={'values': [[now_str]]}
-                    ).execute()
-                    
-                    print(f"[SHEETS] Chave {user_id} desativada na linha {row_index} (C e F) da tabela {SHEET_NAME_PUB_KEY}.")
-                    writes_performed = True
-                    
-                    # 💡 DELAY EXTRA PARA TRATAR DUPLICATAS: Se múltiplas escritas ocorrerem
-                    time.sleep(2.0)
-                    
-                except Exception as e:
-                    print(f"[ERRO API] Falha ao invalidar chave {user_id} na linha {row_index}: {e}")
-                    continue
-        
-        return writes_performed
+        if not rows_to_invalidate:
+            return False
+
+        # 3. Invalida TUDO de uma vez: os pares C (is_active) e F
+        #    (t_desativacao) de todas as linhas do usuário vão em UMA única
+        #    chamada batchUpdate — sem round-trip nem delay por duplicata
+        now_str = current_timestamp()
+        updates = []
+        for row_index in rows_to_invalidate:
+            updates.append({'range': f'{SHEET_NAME_PUB_KEY}!C{row_index}', 'values': [['FALSE']]})
+            updates.append({'range': f'{SHEET_NAME_PUB_KEY}!F{row_index}', 'values': [[now_str]]})
+
+        try:
+            self.batch_write(updates)
+        except Exception as e:
+            print(f"[ERRO API] Falha ao invalidar chave {user_id}: {e}")
+            return False
+
+        for row_index in rows_to_invalidate:
+            print(f"[SHEETS] Chave {user_id} desativada na linha {row_index} (C e F) da tabela {SHEET_NAME_PUB_KEY}.")
+            self._inactive_rows.add(row_index)
+
+        return True
 
 
 # --- 4. FUNÇÕES DE AUDITORIA E VALIDAÇÃO ---
 
+def load_github_cache() -> dict:
+    """Carrega o cache local de ETags/hashes do GitHub (GETs condicionais)."""
+    try:
+        with open(GITHUB_CACHE_FILEPATH, 'rb') as f:
+            raw = f.read()
+        return orjson.loads(raw) if orjson else json.loads(raw)
+    except (FileNotFoundError, ValueError):
+        # Cache ausente ou corrompido: recomeça do zero (falha segura)
+        return {}
+
+def save_github_cache(cache: dict) -> None:
+    """Persiste o cache de ETags/hashes do GitHub em disco."""
+    try:
+        if orjson:
+            payload = orjson.dumps(cache, option=orjson.OPT_INDENT_2)
+        else:
+            payload = json.dumps(cache, indent=2).encode('utf-8')
+        with open(GITHUB_CACHE_FILEPATH, 'wb') as f:
+            f.write(payload)
+    except Exception as e:
+        # Cache é apenas otimização: falha ao salvar não interrompe a auditoria
+        print(f"[AVISO GH] Falha ao salvar cache de ETags: {e}")
+
 def fetch_github_hashes(files_to_check: list[str]) -> dict:
     """
     Busca o conteúdo raw dos arquivos no GitHub e calcula seus hashes SHA-256.
+    Usa GETs condicionais (If-None-Match): em resposta 304, reutiliza o hash
+    do cache local sem transferir o conteúdo novamente.
     Requer a biblioteca 'requests' instalada.
     """
     github_hashes = {}
     # A URL RAW do GitHub usa barras normais (/)
     base_url = f"https://raw.githubusercontent.com/{GITHUB_OWNER}/{GITHUB_REPO}/{GITHUB_BRANCH}"
 
+    cache = load_github_cache()
+    cache_updated = False
+
     for display_name in files_to_check:
         # O caminho no GitHub é o próprio display_name (ex: 'src/eleicoes.py')
         file_url = f"{base_url}/{display_name}"
-        
+        cached = cache.get(display_name, {})
+
+        # Monta o GET condicional quando há ETag + hash em cache
+        headers = {}
+        if cached.get('etag') and cached.get('hash'):
+            headers['If-None-Match'] = cached['etag']
+
         try:
-            # Faz a requisição HTTP
-            response = requests.get(file_url, timeout=10)
+            # Faz a requisição HTTP (condicional, se houver cache)
+            response = requests.get(file_url, timeout=10, headers=headers)
+
+            # 304 Not Modified: conteúdo inalterado, reutiliza o hash em cache
+            if response.status_code == 304:
+                github_hashes[display_name] = cached['hash']
+                continue
+
             response.raise_for_status() # Lança exceção para status 4xx/5xx
 
             # Calcula o Hash SHA-256 do conteúdo raw
             file_hash = hashlib.sha256(response.content).hexdigest()
-            
+
             github_hashes[display_name] = file_hash
-            
+
+            # Atualiza o cache com o novo ETag (se o GitHub enviou um)
+            etag = response.headers.get('ETag')
+            if etag:
+                cache[display_name] = {'etag': etag, 'hash': file_hash}
+                cache_updated = True
+
         except requests.exceptions.RequestException as e:
             # Apenas registra o aviso e continua
             print(f"[AVISO GH] Falha ao buscar '{display_name}' no GitHub: {e}")
-        
+
+    if cache_updated:
+        save_github_cache(cache)
+
     return github_hashes
 
 def generate_hash_of_file(filepath: str) -> Optional[str]:
@@ -326,32 +622,45 @@ def generate_hash_of_file(filepath: str) -> Optional[str]:
     Tenta decodificar primeiro em UTF-8 e, em caso de falha, em CP1252.
     """
     
-    # Lista de codificações a serem tentadas, na ordem de preferência
-    encodings_to_try = ["utf-8", "cp1252"]
+    # 1. Lê os bytes do disco UMA única vez; as tentativas de decodificação
+    # acontecem em memória (antes, cada encoding reabria e relia o arquivo)
+    try:
+        with open(filepath, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        # Se o arquivo não existir, retorna None e para imediatamente
+        return None
+    except Exception as e:
+        # Outros erros (permissão, I/O)
+        print(f"[ERRO HASH] Falha ao calcular hash de {filepath} (Erro fatal de I/O): {e}")
+        return None
+
     content = None
-    
+
+    # Fast path: o BOM UTF-8 nos 3 primeiros bytes identifica a codificação
+    # de cara, sem tentativa e erro. O BOM é decodificado como U+FEFF e
+    # PERMANECE no conteúdo (mesmo comportamento do modo texto anterior, que
+    # o hash Local vs. GitHub já espera).
+    if raw.startswith(b'\xef\xbb\xbf'):
+        try:
+            content = raw.decode("utf-8").replace('\r\n', '\n').replace('\r', '\n')
+        except UnicodeDecodeError:
+            pass  # BOM espúrio em arquivo não-UTF-8: segue o caminho normal
+
+    # Lista de codificações a serem tentadas, na ordem de preferência
+    encodings_to_try = ["utf-8", "cp1252"] if content is None else []
+
     for encoding in encodings_to_try:
         try:
-            # 1. Abre em modo texto ('r') usando a codificação atual e newline=None
-            with open(filepath, "r", encoding=encoding, newline=None) as f:
-                # 2. Lê o conteúdo. Python normaliza as quebras de linha para \n (LF).
-                content = f.read()
-            
-            # Se a leitura for bem-sucedida, saímos do loop
+            # 2. Decodifica em memória e normaliza as quebras de linha para
+            # \n (LF), como o modo texto com newline=None fazia
+            content = raw.decode(encoding).replace('\r\n', '\n').replace('\r', '\n')
             break
-            
         except UnicodeDecodeError:
-            # Se falhar a decodificação (e.g., UTF-8 falhando com 'ç'), 
+            # Se falhar a decodificação (e.g., UTF-8 falhando com 'ç'),
             # o loop continua para a próxima codificação.
-            continue 
-        except FileNotFoundError:
-            # Se o arquivo não existir, retorna None e para imediatamente
-            return None
-        except Exception as e:
-            # Outros erros (permissão, I/O)
-            print(f"[ERRO HASH] Falha ao calcular hash de {filepath} (Erro fatal de I/O): {e}")
-            return None
-    
+            continue
+
     # ----------------------------------------------------------------------
     
     # Verifica se conseguimos ler o conteúdo após tentar todas as codificações
@@ -409,7 +718,7 @@ def generate_audit_hashes(is_production: bool) -> None:
                 display_name = filepath.replace(os.sep, '/')
                 
             entry = {
-                "timestamp": datetime.now().strftime(DATE_FORMAT),
+                "timestamp": current_timestamp(),
                 "arquivo": display_name,
                 "hash_sha256": file_hash
             }
@@ -482,7 +791,7 @@ def generate_audit_hashes(is_production: bool) -> None:
     if meta_hash:
         meta_file_name = DYNAMIC_AUDIT_FILEPATH.replace(os.sep, '/')
         meta_entry = {
-            "timestamp": datetime.now().strftime(DATE_FORMAT),
+            "timestamp": current_timestamp(),
             "arquivo": meta_file_name,
             "hash_sha256": meta_hash
         }
@@ -614,15 +923,20 @@ def generate_audit_hashes(is_production: bool) -> None:
     
     return
 
+# Regex padrão simples, compilada UMA vez (re.match recompunha/verificava o
+# cache de padrões a cada eleitor)
+_EMAIL_RE: Final[re.Pattern] = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
 def is_valid_email(email: str) -> bool:
-    """Valida formato básico de e-mail para evitar rejeição SMTP."""
-    email = email.strip()
+    """
+    Valida formato básico de e-mail para evitar rejeição SMTP.
+    Espera o e-mail JÁ normalizado (strip feito pelo chamador, que
+    precisa do valor limpo de qualquer forma) — sem strip duplicado.
+    """
     if not email: return False
     # Evita erro comum de ponto final
     if email.endswith('.'): return False
-    # Regex padrão simples
-    pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 
 # --- 5. PERSISTÊNCIA LOCAL (CSV) ---
@@ -632,14 +946,13 @@ def load_eleitores() -> List[Eleitor]:
     Carrega a lista de eleitores do CSV e valida o formato dos e-mails.
     O script será ABORTADO imediatamente se for encontrado qualquer e-mail inválido.
     """
-    if not os.path.exists(ELEITORES_FILEPATH): 
-        return []
-    
     eleitores_validos = []
     erros_encontrados = [] # Lista para coletar todos os erros
-    
+
     try:
-        with open(ELEITORES_FILEPATH, mode='r', encoding=ENCODING) as f:
+        # Abre direto (try/except cobre o arquivo ausente): evita o stat extra
+        # do os.path.exists. Buffer grande reduz syscalls de leitura no CSV.
+        with open(ELEITORES_FILEPATH, mode='r', encoding=ENCODING, newline='', buffering=1 << 20) as f:
             reader = csv.reader(f, delimiter=DELIMITER)
             next(reader, None) # Pula o cabeçalho
             
@@ -650,11 +963,15 @@ def load_eleitores() -> List[Eleitor]:
                 email = r[1].strip()
                 
                 if is_valid_email(email):
-                    eleitores_validos.append(Eleitor(nome=nome, email=email))
+                    # Interna o e-mail: comparações no loop de envio viram
+                    # comparação de ponteiro no caso comum
+                    eleitores_validos.append(Eleitor(nome=nome, email=sys.intern(email)))
                 else:
                     # Coleta o erro em vez de apenas alertar
                     erros_encontrados.append(f"Linha {line_num}: '{email}' (Eleitor: {nome})")
-                    
+
+    except FileNotFoundError:
+        return []
     except Exception as e:
         print(f"[ERRO] Falha ao ler eleitores: {e}")
         # Aborta em caso de erro de I/O
@@ -674,36 +991,95 @@ def load_eleitores() -> List[Eleitor]:
         
     return eleitores_validos
 
+def find_eleitor(email: str) -> Optional[Eleitor]:
+    """
+    Busca em streaming um único eleitor pelo e-mail, parando na primeira
+    ocorrência — o caminho de envio unitário não paga o parse (nem a
+    validação global) do CSV inteiro. O e-mail do eleitor encontrado ainda
+    passa pela validação de formato (fail-fast local).
+    """
+    email = email.strip()
+    try:
+        with open(ELEITORES_FILEPATH, mode='r', encoding=ENCODING, newline='', buffering=1 << 20) as f:
+            reader = csv.reader(f, delimiter=DELIMITER)
+            next(reader, None) # Pula o cabeçalho
+
+            for line_num, r in enumerate(reader, start=2):
+                if len(r) < 2: continue # Pula linhas incompletas
+
+                if r[1].strip() != email:
+                    continue
+
+                nome = r[0].strip()
+                if not is_valid_email(email):
+                    print(f"\n🚨 ERRO CRÍTICO: E-mail inválido na linha {line_num}: '{email}' (Eleitor: {nome})")
+                    raise SystemExit(1)
+
+                return Eleitor(nome=nome, email=sys.intern(email))
+
+    except FileNotFoundError:
+        return None
+
+    return None
+
+# O CSV de enviados só contém os literais que o próprio script escreve
+# (str(bool)); a tabela resolve o parse booleano com UM lookup por célula,
+# sem .lower() + comparação por linha
+_BOOL_LITERALS: Final[Dict[str, bool]] = {
+    'True': True, 'False': False,
+    'true': True, 'false': False,
+    'TRUE': True, 'FALSE': False,
+}
+
 def load_enviados() -> List[RegistroEnvio]:
     """Carrega registros de envio (chaves) do CSV local."""
-    if not os.path.exists(ENVIADOS_FILEPATH): return []
     registros = []
+    bool_of = _BOOL_LITERALS.get  # Lookup local: evita resolver o dict por célula
     try:
-        with open(ENVIADOS_FILEPATH, mode='r', encoding=ENCODING) as f:
+        with open(ENVIADOS_FILEPATH, mode='r', encoding=ENCODING, newline='', buffering=1 << 20) as f:
             reader = csv.reader(f, delimiter=DELIMITER)
             next(reader, None) # Pula cabeçalho
             for row in reader:
                 if len(row) < 8: continue
                 registros.append(RegistroEnvio(
                     timestamp=row[0],
-                    email=row[1],
+                    email=sys.intern(row[1]),  # Mesmo objeto str dos eleitores
                     user_id=row[2],
                     pub_key=row[3],
                     generation=int(row[4]),
-                    is_active=(row[5].lower() == 'true'),
-                    is_delivered=(row[6].lower() == 'true'),
-                    is_production=(row[7].lower() == 'true')
+                    is_active=bool_of(row[5], False),
+                    is_delivered=bool_of(row[6], False),
+                    is_production=bool_of(row[7], False)
                 ))
+    except FileNotFoundError:
+        return []
     except Exception as e:
         print(f"[ERRO] Falha ao ler enviados: {e}")
         return []
     return registros
 
+# Handle persistente do log de eventos: aberto UMA vez no primeiro evento
+# (open/close por evento custava 2 syscalls + alocação por linha).
+# O lock serializa as linhas entre o loop principal e os workers do pool.
+_log_file = None
+_log_writer = None
+_log_lock = threading.Lock()
+
+def _close_log_file() -> None:
+    global _log_file, _log_writer
+    if _log_file is not None:
+        try:
+            _log_file.close()
+        except Exception:
+            pass
+        _log_file = None
+        _log_writer = None
+
 def log_event(level: str, email: str, user_id: str, message: str, is_production: bool) -> None:
     """Registra evento no log."""
-    
-    timestamp_str = datetime.now().strftime(DATE_FORMAT) 
-    
+
+    timestamp_str = current_timestamp()
+
     entry = [
         timestamp_str, # Formato: DD/MM/AAAA HH:MM:SS
         str(is_production),
@@ -712,72 +1088,327 @@ def log_event(level: str, email: str, user_id: str, message: str, is_production:
         user_id,
         message.replace(DELIMITER, ' | ') # Evita quebra de coluna
     ]
-    file_exists = os.path.exists(LOG_FILEPATH)
+    global _log_file, _log_writer
     try:
-        with open(LOG_FILEPATH, mode='a', newline='', encoding=ENCODING) as f:
-            writer = csv.writer(f, delimiter=DELIMITER)
-            if not file_exists:
-                writer.writerow(LogEntry.__annotations__.keys())
-            writer.writerow(entry)
+        with _log_lock:
+            if _log_writer is None:
+                file_exists = os.path.exists(LOG_FILEPATH)
+                _log_file = open(LOG_FILEPATH, mode='a', newline='', encoding=ENCODING)
+                _log_writer = csv.writer(_log_file, delimiter=DELIMITER)
+                atexit.register(_close_log_file)
+                if not file_exists:
+                    _log_writer.writerow(LogEntry.__annotations__.keys())
+            _log_writer.writerow(entry)
+            # Eventos INFO ficam no buffer (flush_log nas fronteiras do
+            # lote); níveis de erro vão ao disco na hora — são a parte da
+            # trilha de auditoria que não pode se perder num crash
+            if level != 'INFO':
+                _log_file.flush()
     except Exception as e:
         print(f"[ERRO FATAL] Falha INESPERADA ao escrever no log: {e}")
         sys.exit(1)
 
+def flush_log() -> None:
+    """Descarrega o buffer do log de eventos (chamado nas fronteiras do lote)."""
+    with _log_lock:
+        if _log_file is not None:
+            _log_file.flush()
+
+def _verify_fd_readback(fd: int, expected_hash: str) -> None:
+    """Relê o descritor do início e compara o SHA-256 com o esperado."""
+    os.lseek(fd, 0, os.SEEK_SET)
+    h = hashlib.sha256()
+    while True:
+        chunk = os.read(fd, 1 << 20)
+        if not chunk:
+            break
+        h.update(chunk)
+    if h.hexdigest() != expected_hash:
+        raise OSError("Verificação de releitura falhou: conteúdo gravado difere do esperado.")
+
 def save_enviados_atomically(registros: List[RegistroEnvio]) -> None:
     """
-    Salva a lista completa de registros de forma atômica.
-    
-    Observação: O bloco try/except foi removido. Qualquer falha 
-    (ex: Acesso Negado) é lançada diretamente para o caller, 
+    Salva a lista completa de registros de forma atômica e à prova de queda.
+
+    Em Linux usa O_TMPFILE + linkat: o arquivo nasce anônimo no diretório
+    destino e só ganha nome após escrito, verificado (SHA-256 de releitura)
+    e sincronizado — nunca fica visível com conteúdo parcial. Nos demais
+    sistemas (ou filesystems sem suporte), cai no caminho portátil de
+    arquivo temporário + fsync + os.replace. Em ambos os casos o diretório
+    também recebe fsync para durabilidade do rename.
+
+    Observação: O bloco try/except foi removido. Qualquer falha
+    (ex: Acesso Negado) é lançada diretamente para o caller,
     onde o Fail-Fast obrigatório está implementado.
     """
     temp_filepath = ENVIADOS_FILEPATH + '.tmp'
-    
-    # 1. Escreve no arquivo temporário. Se falhar, lança a exceção.
-    with open(temp_filepath, mode='w', newline='', encoding=ENCODING) as f:
-        writer = csv.writer(f, delimiter=DELIMITER)
-        writer.writerow(RegistroEnvio.__annotations__.keys()) # Escreve cabeçalho
-        for reg in registros:
-            # Usando asdict(reg) é uma suposição, mantenha o que for correto para você
-            writer.writerow(list(asdict(reg).values())) 
-    
-    # 2. Substituição atômica. Se falhar, lança a exceção (ex: WinError 5).
-    os.replace(temp_filepath, ENVIADOS_FILEPATH)
-    
+    dirpath = os.path.dirname(os.path.abspath(ENVIADOS_FILEPATH)) or '.'
+
+    # 1. Serializa tudo em memória: uma única escrita sequencial no disco.
+    # attrgetter + writerows evitam construir um dict por registro (asdict)
+    # e o loop Python linha a linha.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=DELIMITER)
+    writer.writerow(_REGISTRO_FIELDS) # Escreve cabeçalho
+    writer.writerows(map(_REGISTRO_VALUES, registros))
+    payload = buffer.getvalue().encode(ENCODING)
+    payload_hash = hashlib.sha256(payload).hexdigest()
+
+    # 2. Caminho Linux: O_TMPFILE (arquivo anônimo) + linkat via /proc
+    published = False
+    if hasattr(os, 'O_TMPFILE'):
+        try:
+            fd = os.open(dirpath, os.O_TMPFILE | os.O_RDWR, 0o600)
+        except OSError:
+            fd = None  # Filesystem sem suporte a O_TMPFILE: usa o fallback
+        if fd is not None:
+            try:
+                os.write(fd, payload)
+                os.fsync(fd)
+                _verify_fd_readback(fd, payload_hash)
+                # Materializa o arquivo anônimo com um nome temporário...
+                if os.path.lexists(temp_filepath):
+                    os.unlink(temp_filepath)
+                try:
+                    os.link(f'/proc/self/fd/{fd}', temp_filepath, follow_symlinks=True)
+                    linked = True
+                except OSError:
+                    # /proc indisponível ou linkat negado (ex: overlayfs):
+                    # o fallback portátil abaixo assume
+                    linked = False
+            finally:
+                os.close(fd)
+            if linked:
+                # ...e publica com substituição atômica
+                os.replace(temp_filepath, ENVIADOS_FILEPATH)
+                published = True
+
+    # 3. Fallback portátil: tempfile + fsync + os.replace
+    if not published:
+        with open(temp_filepath, mode='wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(temp_filepath, mode='rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() != payload_hash:
+                raise OSError("Verificação de releitura falhou: conteúdo gravado difere do esperado.")
+        # Substituição atômica. Se falhar, lança a exceção (ex: WinError 5).
+        os.replace(temp_filepath, ENVIADOS_FILEPATH)
+
+    # 4. fsync do diretório garante a durabilidade do rename após queda
+    dir_fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
     # Se a função chegar aqui, a operação foi bem-sucedida.
 
 
 # --- 6. GERAÇÃO DE CHAVES E ENCRIPTAÇÃO ---
 
-def generate_key_pair() -> KeyPair:
-    """Gera um user_id e um par de chaves (priv_key, pub_key)."""
-    
-    # 1. Geração do ID numérico 6 dígitos (100000-999999)
+# Protótipo HMAC com o key schedule da MASTER_KEY já absorvido: cada
+# derivação parte de um copy() (memcpy do estado) em vez de reprocessar
+# os blocos ipad/opad da chave a cada chamada
+_hmac_proto: Optional[hmac.HMAC] = None
+
+def _get_hmac_proto(master_key: str) -> hmac.HMAC:
+    global _hmac_proto
+    if _hmac_proto is None:
+        _hmac_proto = hmac.new(master_key.encode(), digestmod='sha256')
+    return _hmac_proto
+
+
+def _random_upper_letters(n: int) -> str:
+    """
+    Gera `n` letras maiúsculas (A-Z) uniformes a partir de UM bloco de
+    bytes do CSPRNG, em vez de `n` chamadas a secrets.choice.
+
+    Amostragem por rejeição: 234 é o maior múltiplo de 26 abaixo de 256,
+    então bytes >= 234 são descartados — o `% 26` dos aceitos é uniforme,
+    sem viés. A sobrealocação de 2 bytes por letra torna raríssimo
+    precisar de um segundo bloco.
+    """
+    letters = []
+    while len(letters) < n:
+        for byte in secrets.token_bytes(2 * (n - len(letters))):
+            if byte < 234:
+                letters.append(string.ascii_uppercase[byte % 26])
+                if len(letters) == n:
+                    break
+    return ''.join(letters)
+
+
+def generate_key_pair(ids_usados: Optional[set] = None) -> KeyPair:
+    """
+    Gera um user_id e um par de chaves (priv_key, pub_key).
+
+    `ids_usados` (construído UMA vez em main a partir do histórico) garante
+    unicidade do ID: em caso de colisão, apenas o ID é reamostrado — o HMAC
+    da chave pública nunca é recalculado.
+    """
+
+    # 1. Geração do ID numérico 6 dígitos (100000-999999), único entre os já emitidos
     user_id = str(secrets.randbelow(900000) + 100000)
+    if ids_usados is not None:
+        while user_id in ids_usados:
+            user_id = str(secrets.randbelow(900000) + 100000)
+        ids_usados.add(user_id)
 
-    # 2. Carregamento da Master Key
-    master_key = ENV.get('MASTER_KEY')
-    if not master_key: 
+    # 2. Master Key (resolvida no import; validada aqui, no ponto de uso)
+    if not MASTER_KEY:
         raise RuntimeError("MASTER_KEY ausente na raiz do env.toml")
 
     # 3. Chave Privada: 12 letras maiúsculas
-    priv_key = ''.join(secrets.choice(string.ascii_uppercase) for _ in range(12)) 
-    
-    # 4. Chave Pública: HMAC-SHA256
-    pub_key = hmac.new(master_key.encode(), priv_key.encode(), 'sha256').hexdigest()
-    
+    priv_key = _random_upper_letters(12)
+
+
+    # 4. Chave Pública: HMAC-SHA256 (via protótipo com key schedule reusado)
+    h = _get_hmac_proto(MASTER_KEY).copy()
+    h.update(priv_key.encode())
+    pub_key = h.hexdigest()
+
+
     return KeyPair(user_id=user_id, priv_key=priv_key, pub_key=pub_key)
 
 
 # --- 7. COMUNICAÇÃO (SMTP) ---
 
+# Cache de resolução DNS do servidor SMTP: (host, port) -> IP.
+# Evita um lookup por reconexão da sessão persistente.
+_smtp_addr_cache: Dict[tuple, str] = {}
+
+def _resolve_smtp_addr(host: str, port: int) -> str:
+    """Resolve (e memoiza) o endereço IP do servidor SMTP."""
+    key = (host, port)
+    if key not in _smtp_addr_cache:
+        _smtp_addr_cache[key] = socket.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )[0][4][0]
+    return _smtp_addr_cache[key]
+
+class SMTPSession:
+    """
+    Mantém uma única conexão SMTP_SSL autenticada para todos os envios,
+    amortizando o custo do handshake TLS + AUTH entre os eleitores.
+
+    A conexão é aberta de forma preguiçosa no primeiro envio. Antes de cada
+    envio faz uma verificação de saúde via NOOP e reconecta se a conexão
+    tiver caído; se o socket morrer entre o health check e o envio, a
+    mensagem é reenviada UMA vez após reconectar. A conexão também é
+    rotacionada a cada SMTP_MAX_MSGS_PER_CONNECTION mensagens para
+    respeitar limites por conexão dos provedores SMTP.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.server: Optional[smtplib.SMTP_SSL] = None
+        self.msgs_sent = 0
+        self.last_used = 0.0
+
+    def _connect(self) -> None:
+        """(Re)abre a conexão SMTP_SSL e autentica."""
+        self._close_quietly()
+        try:
+            addr = _resolve_smtp_addr(self.host, self.port)
+        except OSError:
+            addr = self.host  # Sem cache: deixa o smtplib resolver
+        # Conecta pelo IP pré-resolvido, mas preserva o hostname original
+        # em _host para SNI e validação do certificado TLS
+        server = smtplib.SMTP_SSL(context=SSL_CONTEXT)
+        server._host = self.host
+        server.connect(addr, self.port)
+        server.login(self.user, self.password)
+        self.server = server
+        self.msgs_sent = 0
+        self.last_used = time.monotonic()
+
+    def _close_quietly(self) -> None:
+        """Encerra a conexão atual ignorando erros (socket pode já estar morto)."""
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def _ensure_healthy(self) -> None:
+        """Health check via NOOP; reconecta se a sessão caiu ou expirou a cota."""
+        if self.server is None or self.msgs_sent >= SMTP_MAX_MSGS_PER_CONNECTION:
+            self._connect()
+            return
+        # NOOP preguiçoso: em ritmo de envio a conexão acabou de ser usada
+        # e está comprovadamente viva — o round-trip extra só é pago se a
+        # sessão ficou ociosa tempo suficiente para o provedor derrubá-la
+        if time.monotonic() - self.last_used < SMTP_IDLE_NOOP_SECONDS:
+            return
+        try:
+            code, _ = self.server.noop()
+            if code != 250:
+                self._connect()
+                return
+            # Sessão ociosa revalidada: RSET zera qualquer estado de
+            # envelope residual antes do próximo MAIL FROM
+            self.server.rset()
+        except Exception:
+            self._connect()
+
+    def send(self, msg_bytes: bytes, from_addr: str, to_addrs: List[str]) -> None:
+        """
+        Envia uma mensagem JÁ serializada pela conexão persistente.
+        Receber bytes + envelope explícito evita que o smtplib reexecute o
+        generator MIME e o parse de cabeçalhos a cada envio.
+        """
+        self._ensure_healthy()
+        # A ORDEM dos handlers importa: SMTPException é subclasse de OSError
+        # (desde o Python 3.4), então os erros de PROTOCOLO precisam ser
+        # tratados antes do caso genérico de socket.
+        try:
+            self.server.sendmail(from_addr, to_addrs, msg_bytes)
+        except smtplib.SMTPServerDisconnected:
+            # Socket caiu entre o health check e o envio: reconecta e
+            # tenta novamente UMA única vez
+            self._connect()
+            self.server.sendmail(from_addr, to_addrs, msg_bytes)
+        except smtplib.SMTPException:
+            # Erro de protocolo (ex.: RCPT recusado, DATA parcial): a
+            # conexão está viva — NÃO reenviar (o servidor pode já ter
+            # aceitado a mensagem). RSET limpa o envelope para a próxima
+            # mensagem não herdar estado; se nem o RSET passar, derruba a
+            # conexão — o próximo envio reconecta do zero
+            try:
+                self.server.rset()
+                self.last_used = time.monotonic()
+            except Exception:
+                self._close_quietly()
+            raise
+        except OSError:
+            # Falha de socket fora do protocolo SMTP (conexão morta em
+            # silêncio): reconecta e tenta novamente UMA única vez
+            self._connect()
+            self.server.sendmail(from_addr, to_addrs, msg_bytes)
+        self.msgs_sent += 1
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        self._close_quietly()
+
+@functools.lru_cache(maxsize=1)
 def load_template_html() -> str:
-    """Carrega o conteúdo do template HTML para e-mail."""
+    """
+    Carrega o conteúdo do template HTML para e-mail.
+
+    O lru_cache faz a leitura acontecer UMA vez por execução (o arquivo
+    não muda enquanto o script roda); chamadas seguintes são um lookup.
+    """
     # Usando a constante ENCODING do script ('utf-8-sig')
     if os.path.exists(TEMPLATE_FILEPATH):
-        with open(TEMPLATE_FILEPATH, 'r', encoding=ENCODING) as f: 
+        with open(TEMPLATE_FILEPATH, 'r', encoding=ENCODING) as f:
             return f.read()
-    
+
     # Template de fallback seguro (para o caso de o arquivo não existir)
     return (
         "<html><body>"
@@ -787,30 +1418,77 @@ def load_template_html() -> str:
         "</body></html>"
     )
 
-def send_email(eleitor: Eleitor, keys: KeyPair, is_production: bool) -> bool:
+# Contexto fixo do template: constante por execução, montado uma única vez
+STATIC_TEMPLATE_DATA: Final[Dict[str, Any]] = {
+    'link_votacao': BASE_FORM_URL,
+    'ano': ANO_ELEICAO,
+    'from_name': FROM_NAME,
+    'data_inicio_votacao': DATA_INICIO_VOTACAO,
+    'data_fim_votacao': DATA_FIM_VOTACAO,
+}
+
+# Sentinelas dos 4 campos por eleitor (o \x00 não ocorre em templates nem
+# em dados reais); o restante do contexto fica "assado" no pré-render
+_DYNAMIC_SENTINELS: Final[Dict[str, str]] = {
+    'nome': '\x00nome\x00',
+    'user_id': '\x00user_id\x00',
+    'priv_key': '\x00priv_key\x00',
+    'pub_key': '\x00pub_key\x00',
+}
+
+# Regex que casa qualquer sentinela: permite substituir os 4 campos em UMA
+# passada sobre o template (4 str.replace percorrem o HTML 4 vezes)
+_SENTINEL_RE: Final[re.Pattern] = re.compile(
+    '|'.join(map(re.escape, _DYNAMIC_SENTINELS.values()))
+)
+
+# Corpo texto pré-montado com as MESMAS sentinelas do HTML: a parte fixa
+# (ano, datas, link, assinatura) é interpolada uma única vez no import
+TEXT_TEMPLATE: Final[str] = (
+    f"Olá {_DYNAMIC_SENTINELS['nome']},\n\n"
+    f"Seguem seus dados para a Eleição AGESP {ANO_ELEICAO}:\n\n"
+    f"Período        : {DATA_INICIO_VOTACAO} a {DATA_FIM_VOTACAO}\n"
+    f"ID de Validação: {_DYNAMIC_SENTINELS['user_id']}\n"
+    f"Chave Privada  : {_DYNAMIC_SENTINELS['priv_key']}\n"
+    f"Chave Pública  : {_DYNAMIC_SENTINELS['pub_key']}\n"
+    f"Link de Votação: {BASE_FORM_URL}\n\n"
+    f"Atenciosamente,\n{FROM_NAME}"
+)
+
+@functools.lru_cache(maxsize=1)
+def prerender_template_html() -> str:
     """
-    Constrói, envia (ou simula) o e-mail e registra o log, 
+    Pré-renderiza o template HTML UMA vez por execução: os campos fixos
+    (ano, datas, link) são substituídos de verdade e os 4 campos por
+    eleitor viram sentinelas. Cada envio faz então 4 str.replace em vez
+    de reparsear o template inteiro com format_map. Um KeyError de
+    variável faltando estoura aqui, logo no primeiro envio.
+    """
+    return load_template_html().format_map({**STATIC_TEMPLATE_DATA, **_DYNAMIC_SENTINELS})
+
+def send_email(eleitor: Eleitor, keys: KeyPair, is_production: bool,
+               smtp_session: Optional[SMTPSession] = None) -> bool:
+    """
+    Constrói, envia (ou simula) o e-mail e registra o log,
     mantendo a formatação detalhada de simulação no terminal.
+    Quando `smtp_session` é fornecida, reutiliza a conexão persistente
+    em vez de abrir uma nova conexão SMTP_SSL por mensagem.
     """
-    # 1. Preparação
-    ano = datetime.now().year
-    html_tmpl = load_template_html() # Usa a função auxiliar
-    
-    template_data = {
-        'nome': eleitor.nome,
-        'user_id': keys.user_id,
-        'priv_key': keys.priv_key,      
-        'pub_key': keys.pub_key, 
-        'link_votacao': BASE_FORM_URL, 
-        'ano': ano, 
-        'from_name': FROM_NAME,
-        'data_inicio_votacao': DATA_INICIO_VOTACAO,
-        'data_fim_votacao': DATA_FIM_VOTACAO
-    }
-
-    # Preenche o template com TODAS as variáveis necessárias
+    # 1. Preparação: template pré-renderizado (estáticos já substituídos);
+    # os 4 campos por eleitor entram em UMA passada de regex sobre o HTML
     try:
-        html_content = html_tmpl.format(**template_data)
+        dynamic_values = {
+            # O nome vem do CSV (dado externo): escapa UMA vez para o HTML.
+            # As chaves/ID são geradas pelo script ([A-Z]/hex/dígitos) e não
+            # contêm metacaracteres — entram como estão.
+            _DYNAMIC_SENTINELS['nome']: html.escape(eleitor.nome),
+            _DYNAMIC_SENTINELS['user_id']: keys.user_id,
+            _DYNAMIC_SENTINELS['priv_key']: keys.priv_key,
+            _DYNAMIC_SENTINELS['pub_key']: keys.pub_key,
+        }
+        html_content = _SENTINEL_RE.sub(
+            lambda m: dynamic_values[m.group(0)], prerender_template_html()
+        )
     except KeyError as e:
         print(f"[ERRO FATAL] Variável faltando no template HTML: {e}")
         log_event(
@@ -832,42 +1510,29 @@ def send_email(eleitor: Eleitor, keys: KeyPair, is_production: bool) -> bool:
         )
          return False
     
-    # Conteúdo de texto simples (Formato detalhado desejado pelo usuário)
-    text_content = (
-        f"Olá {eleitor.nome},\n\n"
-        f"Seguem seus dados para a Eleição AGESP {ano}:\n\n"
-        f"Período        : {DATA_INICIO_VOTACAO} a {DATA_FIM_VOTACAO}\n"
-        f"ID de Validação: {keys.user_id}\n"
-        f"Chave Privada  : {keys.priv_key}\n"
-        f"Chave Pública  : {keys.pub_key}\n"
-        f"Link de Votação: {BASE_FORM_URL}\n\n"
-        f"Atenciosamente,\n{FROM_NAME}"
-    )
-
-    # 2. Construção da Mensagem EmailMessage
-    msg = EmailMessage()
-    msg["Subject"] = SUBJECT 
-    msg["From"] = formataddr((FROM_NAME, SMTP_USER))
-    msg["To"] = eleitor.email
-    msg.set_content(text_content) # Conteúdo de texto simples
-    msg.add_alternative(html_content, subtype="html") # Conteúdo HTML
-    
-    # 3. Envio / Simulação
+    # Conteúdo de texto simples: mesma passada única de sentinelas do HTML
+    # (aqui o nome entra SEM escape — é texto puro, não markup)
+    text_values = {**dynamic_values, _DYNAMIC_SENTINELS['nome']: eleitor.nome}
+    text_content = _SENTINEL_RE.sub(lambda m: text_values[m.group(0)], TEXT_TEMPLATE)
+
+    # 2/3. Construção da Mensagem + Envio / Simulação
+    # A EmailMessage (árvore MIME, headers, encodings) só é montada no modo
+    # de produção: a simulação valida template + dados e imprime o texto,
+    # sem pagar a construção de uma mensagem que nunca será enviada
     success = False
     log_msg = ""
     log_level = 'INFO'
 
     if not is_production:
-        # MODO DE TESTE: Formato de simulação detalhado
-        print("\n" + "="*60)
-        print(f"🧪 [TESTE] E-MAIL SIMULADO PARA: {eleitor.email}")
-        print("-" * 60)
-        print(f"ASSUNTO: {SUBJECT}")
-        print("\nCONTEÚDO (Visualização):")
-        # Imprime o conteúdo de texto formatado
-        print("    " + "\n    ".join(text_content.split('\n'))) 
-        print("="*60 + "\n")
-        
+        # MODO DE TESTE: uma linha no terminal; o corpo completo só é
+        # emitido em nível DEBUG (--verbose), cortando ~12 writes por
+        # eleitor em dry-runs grandes
+        print(f"🧪 [TESTE] E-mail simulado para: {eleitor.email}")
+        logger.debug(
+            "E-MAIL SIMULADO PARA: %s\nASSUNTO: %s\nCONTEÚDO:\n%s",
+            eleitor.email, SUBJECT, text_content
+        )
+
         success = True
         log_msg = "Simulação de envio bem-sucedida."
         log_level = 'INFO'
@@ -881,22 +1546,37 @@ def send_email(eleitor: Eleitor, keys: KeyPair, is_production: bool) -> bool:
         else:
             try:
                 print(f"[INFO] Tentando enviar e-mail para: {eleitor.email}...")
-                ctx = ssl.create_default_context()
-                
-                with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=ctx) as server:
-                    server.login(SMTP_USER, smtp_password)
-                    server.send_message(msg)
-                    
-                    success = True
-                    log_msg = "E-mail enviado com sucesso (SMTP)."
-
-                    # ----------------------------------------------------
-                    # >>> PONTO DE INTERRUPÇÃO PARA TESTE (PRODUÇÃO) <<<
-                    # ATENÇÃO: COMENTE ou REMOVA esta linha após o teste!
-                    # print("[TESTE DE FALHA] PRODUÇÃO: Interrompendo após o envio SMTP.")
-                    # sys.exit(1)
-                    # ----------------------------------------------------
-            
+
+                msg = EmailMessage()
+                msg["Subject"] = SUBJECT
+                msg["From"] = FROM_HEADER
+                msg["To"] = eleitor.email
+                msg.set_content(text_content) # Conteúdo de texto simples
+                msg.add_alternative(html_content, subtype="html") # Conteúdo HTML
+
+                # Serializa UMA vez (política SMTP = CRLF) e envia com
+                # envelope explícito, sem reconstrução por parte do smtplib
+                msg_bytes = msg.as_bytes(policy=email_policy.SMTP)
+
+                if smtp_session is not None:
+                    # Conexão persistente: TLS + AUTH já amortizados
+                    smtp_session.send(msg_bytes, SMTP_USER, [eleitor.email])
+                else:
+                    # Fallback: conexão avulsa (ex.: envio unitário)
+                    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=SSL_CONTEXT) as server:
+                        server.login(SMTP_USER, smtp_password)
+                        server.sendmail(SMTP_USER, [eleitor.email], msg_bytes)
+
+                success = True
+                log_msg = "E-mail enviado com sucesso (SMTP)."
+
+                # ----------------------------------------------------
+                # >>> PONTO DE INTERRUPÇÃO PARA TESTE (PRODUÇÃO) <<<
+                # ATENÇÃO: COMENTE ou REMOVA esta linha após o teste!
+                # print("[TESTE DE FALHA] PRODUÇÃO: Interrompendo após o envio SMTP.")
+                # sys.exit(1)
+                # ----------------------------------------------------
+
             # Tratamento de Erros Detalhado (Mantido robusto)
             except smtplib.SMTPAuthenticationError:
                 log_msg = "Falha de autenticação SMTP. Senha ou usuário incorretos."
@@ -938,54 +1618,89 @@ from datetime import datetime
 # save_enviados_atomically, send_email, log_event, DATE_FORMAT, SHEET_NAME_PUB_KEY, 
 # SYSTEM_LOG_USER, SYSTEM_LOG_EMAIL, ...
 
-def process_eleitor(eleitor: Eleitor, sheet_service: GoogleSheetsService, force_resend: bool, production: bool) -> None:
+# Serializa o estado compartilhado do loop de envio (lista de registros,
+# índice por e-mail, ids emitidos e o rewrite do CSV de enviados) entre os
+# workers do pool SMTP e o loop principal
+_registros_lock = threading.Lock()
+
+def build_enviados_index(registros: List[RegistroEnvio]) -> Dict[str, List[RegistroEnvio]]:
+    """Constrói o índice email -> registros para consulta O(1) no loop de envio."""
+    index: Dict[str, List[RegistroEnvio]] = {}
+    for r in registros:
+        index.setdefault(r.email, []).append(r)
+    return index
+
+def process_eleitor(eleitor: Eleitor, sheet_service: GoogleSheetsService,
+                    registros: List[RegistroEnvio], enviados_index: Dict[str, List[RegistroEnvio]],
+                    force_resend: bool, production: bool,
+                    smtp_session: Optional[SMTPSession] = None,
+                    ids_usados: Optional[set] = None,
+                    flush_commit: bool = True,
+                    sheets_pool: Optional[ThreadPoolExecutor] = None,
+                    batch_stats: Optional[BatchStats] = None) -> Optional[Future]:
     """
     Processa um único eleitor com persistência segura (Write-Ahead Logging).
-    
-    1. Gera chaves e salva em disco como PENDENTE (is_delivered=False). 
+
+    1. Gera chaves e salva em disco como PENDENTE (is_delivered=False).
        -> FAIL-FAST OBRIGATÓRIO AQUI.
     2. Envia o e-mail (Ação de Risco).
     3. Se sucesso, atualiza o Google Sheets.
     4. Atualiza disco para ENTREGUE (is_delivered=True) e ATIVO (is_active=True).
+
+    `registros` e `enviados_index` são carregados UMA vez em main() e
+    compartilhados por todo o loop (evita reler o CSV por eleitor).
+
+    Com `sheets_pool`, a etapa 3 (Sheets) é submetida ao pool e o Future
+    correspondente é retornado — o commit em disco fica com o chamador,
+    que deve drenar o pool antes de salvar.
     """
-    
-    # 0. Preparação de Dados
-    registros_antigos = load_enviados()
-    registro_atual = next((r for r in registros_antigos if r.email == eleitor.email), None)
-    
-    # 1. Checagem de Reenvio
-    if registro_atual and registro_atual.is_delivered and not force_resend:
-        print(f"[PULAR] Eleitor {eleitor.nome} ({eleitor.email}) já processado com sucesso (Geração {registro_atual.generation}).")
-        return
 
-    # 2. Geração de Chaves
-    keys = generate_key_pair()
-    new_generation = (registro_atual.generation + 1) if registro_atual else 1
-    timestamp_now = datetime.now().strftime(DATE_FORMAT)
+    # Etapas 0-3 mexem no estado compartilhado (índice, lista, ids, CSV):
+    # rodam sob o lock para que os workers do pool não se atropelem. O
+    # envio em si (etapa 4, a parte lenta) fica FORA do lock.
+    with _registros_lock:
+        # 0. Preparação de Dados (lookup O(1) via índice por e-mail)
+        historico_eleitor = enviados_index.get(eleitor.email, [])
+        registro_atual = historico_eleitor[0] if historico_eleitor else None
+
+        # 1. Checagem de Reenvio
+        if registro_atual and registro_atual.is_delivered and not force_resend:
+            print(f"[PULAR] Eleitor {eleitor.nome} ({eleitor.email}) já processado com sucesso (Geração {registro_atual.generation}).")
+            return
+
+        # 2. Geração de Chaves
+        keys = generate_key_pair(ids_usados)
+        new_generation = max((r.generation for r in historico_eleitor), default=0) + 1
+        timestamp_now = current_timestamp()
+
+        # 3. PERSISTÊNCIA ETAPA 1: REGISTRO "PENDENTE" (FAIL-FAST)
+        # Criamos o registro marcando como NÃO ENTREGUE e NÃO ATIVO.
+        novo_registro = RegistroEnvio(
+            timestamp=timestamp_now,
+            email=eleitor.email,
+            user_id=keys.user_id,
+            pub_key=keys.pub_key,
+            generation=new_generation,
+            is_active=False,      # Ainda não ativada no Sheets
+            is_delivered=False,   # Ainda não enviado
+            is_production=production
+        )
 
-    # 3. PERSISTÊNCIA ETAPA 1: REGISTRO "PENDENTE" (FAIL-FAST)
-    # Criamos o registro marcando como NÃO ENTREGUE e NÃO ATIVO.
-    novo_registro = RegistroEnvio(
-        timestamp=timestamp_now,
-        email=eleitor.email,
-        user_id=keys.user_id,
-        pub_key=keys.pub_key,
-        generation=new_generation,
-        is_active=False,      # Ainda não ativada no Sheets
-        is_delivered=False,   # Ainda não enviado
-        is_production=production
-    )
+        # Remove registro antigo da memória (lista e índice) e adiciona o novo (Pendente)
+        registros[:] = [r for r in registros if r.email != eleitor.email]
+        registros.append(novo_registro)
+        enviados_index[eleitor.email] = [novo_registro]
 
-    # Remove registro antigo da memória e adiciona o novo (Pendente)
-    lista_atualizada = [r for r in registros_antigos if r.email != eleitor.email]
-    lista_atualizada.append(novo_registro)
-    
-    # === BLOCO FAIL-FAST ===
-    try:
-        # Tenta salvar o estado PENDENTE no disco
-        save_enviados_atomically(lista_atualizada) 
-        
-    except Exception as e:
+        # === BLOCO FAIL-FAST ===
+        try:
+            # Tenta salvar o estado PENDENTE no disco
+            save_enviados_atomically(registros)
+            persist_error = None
+        except Exception as e:
+            persist_error = e
+
+    if persist_error is not None:
+        e = persist_error
         # ERRO FATAL: Falha na persistência. Devemos interromper imediatamente.
         error_msg = f'ERRO FATAL: Falha ao persistir registro PENDENTE em disco (Etapa 1). O script não pode prosseguir sem registro de auditoria. Erro: {e}'
         
@@ -1013,7 +1728,32 @@ def process_eleitor(eleitor: Eleitor, sheet_service: GoogleSheetsService, force_
     )
 
     # 4. AÇÃO DE RISCO: Envio de E-mail
-    is_delivered = send_email(eleitor, keys, production)
+    #    Em paralelo, pré-carrega o índice de linhas do Sheets que a
+    #    invalidação vai precisar — sobrepõe o RTT dos dois provedores sem
+    #    antecipar a revogação da chave antiga (que continua condicionada
+    #    ao sucesso do envio).
+    #    A pré-carga vai para o MESMO worker único do `sheets_pool`: o
+    #    transporte httplib2 do client NÃO é thread-safe, então toda RPC de
+    #    Sheets precisa ficar serializada nele (e o worker executa a
+    #    pré-carga antes de qualquer `finalizar_sheets` submetido depois).
+    prefetch_thread = None
+    if registro_atual is not None:
+        if sheets_pool is not None:
+            sheets_pool.submit(sheet_service.prefetch_row_index)
+        else:
+            # Sem pool o processamento é sequencial: a thread avulsa só
+            # disputa com o SMTP deste eleitor, nunca com outra RPC.
+            prefetch_thread = threading.Thread(
+                target=sheet_service.prefetch_row_index, daemon=True
+            )
+            prefetch_thread.start()
+
+    is_delivered = send_email(eleitor, keys, production, smtp_session)
+    if batch_stats is not None:
+        batch_stats.record(is_delivered)
+
+    if prefetch_thread is not None:
+        prefetch_thread.join()
 
     # 5. TRATAMENTO DO RESULTADO (Se falhou o envio, apenas registra o estado e sai)
     if not is_delivered:
@@ -1024,56 +1764,87 @@ def process_eleitor(eleitor: Eleitor, sheet_service: GoogleSheetsService, force_
     # SE CHEGAMOS AQUI, O E-MAIL FOI ENVIADO (ou simulado) COM SUCESSO.
 
     # 6. ATUALIZAÇÃO GOOGLE SHEETS (Se falhar aqui, o estado é de alto risco)
-    try:
-        # a. Invalida anteriores no Sheets
-        if registro_atual:
-             if sheet_service.invalidate_old_key(registro_atual.user_id):
-                time.sleep(3.0) 
-
-        # b. Insere nova chave no Sheets
-        sheet_service.append_row(SHEET_NAME_PUB_KEY, [
-            keys.user_id,
-            keys.pub_key,
-            True,       # ATIVA
-            production,
-            timestamp_now,
-            '' 
-        ])
-        time.sleep(2.0)
+    # A finalização continua condicionada ao SUCESSO do envio; quando há um
+    # `sheets_pool`, ela roda em um worker único (serializa as escritas
+    # contra a cota) enquanto o loop já avança para o SMTP do próximo eleitor.
+    def finalizar_sheets() -> None:
+        try:
+            # a. Invalida anteriores no Sheets (itera SOMENTE o histórico do
+            #    próprio eleitor, não o registro completo)
+            # Sem delay fixo: a proteção de cota agora é o backoff reativo
+            # (HTTP 429/503) dentro do próprio GoogleSheetsService.
+            # IMPORTANTE: o is_active do CSV local NÃO dispensa a chamada —
+            # um crash entre o append no Sheets e o save do CSV deixa uma
+            # chave ATIVA lá com is_active=False aqui, e só o Sheets (via
+            # índice de linhas em memória, lookup sem RPC quando não há
+            # linha ativa) sabe revogar esse órfão
+            for registro_antigo in historico_eleitor:
+                sheet_service.invalidate_old_key(registro_antigo.user_id)
+
+            # b. Insere nova chave no Sheets
+            sheet_service.append_row(SHEET_NAME_PUB_KEY, [
+                keys.user_id,
+                keys.pub_key,
+                True,       # ATIVA
+                production,
+                timestamp_now,
+                ''
+            ])
 
-        log_event(
-            level='INFO', 
-            email=eleitor.email, 
-            user_id=keys.user_id, 
-            message='Google Sheets atualizado com nova chave ativa.', 
-            is_production=production
-        )
-        
-        # Estado de sucesso total
-        novo_registro.is_active = True 
-        
-    except Exception as e:
-        # Se falhar no Sheets, o usuário recebeu o email (is_delivered=True) mas a chave não foi ativada.
-        # Isto é um ERRO CRÍTICO que exige atenção manual.
-        log_event(
-            level='ERRO CRÍTICO',
-            email=eleitor.email,
-            user_id=keys.user_id,
-            message=f'E-mail enviado, mas falha ao salvar no Sheets (chave pode estar INATIVA). Erro: {e}',
-            is_production=production
-        )
-        print(f"[ERRO CRÍTICO] E-mail enviado para {eleitor.email}, mas falha ao salvar no Sheets: {e}")
-        
-        # Atualizamos o CSV para refletir que o e-mail foi enviado (mas a chave NÃO está ativa)
-        novo_registro.is_active = False 
+            log_event(
+                level='INFO',
+                email=eleitor.email,
+                user_id=keys.user_id,
+                message='Google Sheets atualizado com nova chave ativa.',
+                is_production=production
+            )
+
+            # Estado de sucesso total
+            chave_ativa = True
+
+        except Exception as e:
+            # Se falhar no Sheets, o usuário recebeu o email (is_delivered=True) mas a chave não foi ativada.
+            # Isto é um ERRO CRÍTICO que exige atenção manual.
+            log_event(
+                level='ERRO CRÍTICO',
+                email=eleitor.email,
+                user_id=keys.user_id,
+                message=f'E-mail enviado, mas falha ao salvar no Sheets (chave pode estar INATIVA). Erro: {e}',
+                is_production=production
+            )
+            print(f"[ERRO CRÍTICO] E-mail enviado para {eleitor.email}, mas falha ao salvar no Sheets: {e}")
+
+            # Atualizamos o CSV para refletir que o e-mail foi enviado (mas a chave NÃO está ativa)
+            chave_ativa = False
+
+        # PERSISTÊNCIA ETAPA 2 (memória): o e-mail foi entregue
+        # independentemente do resultado do Sheets. Os dois campos mudam
+        # sob o MESMO lock dos saves de etapa 1: um save concorrente nunca
+        # pode fotografar is_active=True com is_delivered=False.
+        with _registros_lock:
+            novo_registro.is_active = chave_ativa
+            novo_registro.is_delivered = True
+
+    if sheets_pool is not None:
+        # O commit em disco fica a cargo do flush periódico em main(), que
+        # drena o pool ANTES de salvar (nunca persiste estado parcial)
+        print(f"[SUCESSO] Envio para {eleitor.nome} concluído. Geração: {new_generation} (Sheets em segundo plano)")
+        return sheets_pool.submit(finalizar_sheets)
+
+    finalizar_sheets()
 
     # 7. PERSISTÊNCIA ETAPA 2: SUCESSO TOTAL (COMMIT)
-    # Atualiza o objeto em memória para refletir que o e-mail foi entregue (independentemente do Sheets)
-    novo_registro.is_delivered = True
-    
+
+    # O commit em disco pode ser diferido (flush periódico no loop de main):
+    # o pior caso de um crash entre flushes é um registro PENDENTE com log de
+    # envio — exatamente o estado que o reprocessamento já sabe tratar.
+    if not flush_commit:
+        print(f"[SUCESSO] Processamento de {eleitor.nome} concluído. Geração: {new_generation} (commit diferido)")
+        return
+
     # Salvamos novamente no disco para confirmar o estado final (Entregue e/ou Ativo)
     try:
-        save_enviados_atomically(lista_atualizada)
+        save_enviados_atomically(registros)
         print(f"[SUCESSO] Processamento de {eleitor.nome} concluído. Geração: {new_generation}")
     except Exception as e:
         # Falhar no COMMIT final é menos grave, pois o e-mail já foi enviado.
@@ -1101,6 +1872,7 @@ def main():
     parser.add_argument('--production', action='store_true', help="Ativa o modo de produção (envios REAIS de e-mail).")
     parser.add_argument('--resend', action='store_true', help="Força o reenvio de credenciais (gera nova chave) para TODOS. USE COM CAUTELA!")
     parser.add_argument('--skip-audit', action='store_true', help="Pula a auditoria de hashes com o GitHub para testes locais. NÃO USE EM PRODUÇÃO!")
+    parser.add_argument('--verbose', action='store_true', help="Exibe detalhes de depuração (ex: corpo completo dos e-mails simulados).")
     args = parser.parse_args()
 
     # --- INÍCIO DO REDIRECIONAMENTO DE SAÍDA ---
@@ -1108,7 +1880,15 @@ def main():
     try:
         # 1. Configura o Tee logo após o parsing
         tee_output = Tee(TERMINAL_LOG_FILEPATH)
-        sys.stdout = tee_output 
+        sys.stdout = tee_output
+
+        # Logging de depuração passa pelo Tee (terminal + arquivo);
+        # sem --verbose, mensagens DEBUG são descartadas a custo zero
+        logging.basicConfig(
+            level=logging.DEBUG if args.verbose else logging.INFO,
+            format='%(message)s',
+            stream=sys.stdout
+        )
 
         # 2. Registro do Tempo de Início (com separador robusto)
         start_time = datetime.now()
@@ -1158,20 +1938,29 @@ def main():
         # O bloco try/except/finally original do usuário (Lógica Principal)
         try:
             sheet_service = GoogleSheetsService(SPREADSHEET_ID)
-            eleitores = load_eleitores()
-            
-            if not eleitores:
-                print("[AVISO] Nenhum eleitor encontrado.")
-                return
+
+            # Histórico de envios: UMA leitura do CSV + índice por e-mail,
+            # compartilhados por todo o loop de processamento.
+            registros = load_enviados()
+            enviados_index = build_enviados_index(registros)
+            # IDs já emitidos: conjunto único por execução, atualizado a
+            # cada geração (garante unicidade sem varrer o histórico)
+            ids_usados = {r.user_id for r in registros}
 
             targets = []
             if args.destinatario.upper() == 'TODOS':
+                eleitores = load_eleitores()
+                if not eleitores:
+                    print("[AVISO] Nenhum eleitor encontrado.")
+                    return
                 targets = eleitores
             else:
-                found = next((e for e in eleitores if e.email == args.destinatario), None)
+                # Fast path unitário: busca em streaming e para na primeira
+                # ocorrência, sem o parse completo da lista de eleitores
+                found = find_eleitor(args.destinatario)
                 if found:
                     targets = [found]
-                    args.resend = True  
+                    args.resend = True
                 else:
                     print(f"[ERRO] Eleitor {args.destinatario} não encontrado na lista (ou o e-mail é inválido).")
                     return
@@ -1184,13 +1973,124 @@ def main():
                 print("[INFO] A ordem é irreprodutível e garante a máxima proteção contra inferência de ID/Chave.")
 
             print(f"[INFO] Iniciando processamento de {len(targets)} eleitor(es)...")
-            
-            for eleitor in targets:
-                process_eleitor(eleitor, sheet_service, args.resend, args.production)
+
+            # Pool de envio: cada worker cria (no primeiro uso) e reutiliza a
+            # PRÓPRIA conexão SMTP persistente, via threading.local
+            smtp_password = ENV.get('SMTP_PASSWORD') if args.production else None
+            smtp_local = threading.local()
+            smtp_sessions: List[SMTPSession] = []
+            smtp_sessions_lock = threading.Lock()
+
+            def get_smtp_session() -> Optional[SMTPSession]:
+                if not smtp_password:
+                    return None
+                session = getattr(smtp_local, 'session', None)
+                if session is None:
+                    session = SMTPSession(SMTP_HOST, SMTP_PORT, SMTP_USER, smtp_password)
+                    smtp_local.session = session
+                    with smtp_sessions_lock:
+                        smtp_sessions.append(session)
+                return session
+
+            if smtp_password:
+                print(f"[INFO] Pool SMTP com {SMTP_POOL_SIZE} conexões persistentes preparado (login no primeiro envio de cada worker).")
+
+            # Ritmo de envio: o token bucket desconta o tempo já gasto no
+            # próprio envio, em vez de dormir o intervalo cheio a cada eleitor
+            rate_limiter = TokenBucket(EMAIL_SEND_INTERVAL_SECONDS, burst=SMTP_POOL_SIZE)
+
+            # Pipeline: a finalização no Sheets do eleitor i roda em um worker
+            # único (escritas serializadas contra a cota) enquanto o SMTP do
+            # eleitor i+1 já avança
+            sheets_pool = ThreadPoolExecutor(max_workers=1)
+            smtp_pool = ThreadPoolExecutor(max_workers=SMTP_POOL_SIZE)
+            pending_sheets: List[Future] = []
+
+            def drain_sheets() -> None:
+                # As exceções são tratadas DENTRO de finalizar_sheets;
+                # aqui só esperamos o lote terminar
+                for future in pending_sheets:
+                    future.result()
+                pending_sheets.clear()
+
+            # Disjuntor do lote: >= 1/3 de falhas com o lote já maduro
+            # interrompe as submissões restantes
+            batch_stats = BatchStats()
+
+            def enviar_eleitor(eleitor: Eleitor) -> Optional[Future]:
+                return process_eleitor(eleitor, sheet_service, registros, enviados_index,
+                                       args.resend, args.production, get_smtp_session(),
+                                       ids_usados, sheets_pool=sheets_pool,
+                                       batch_stats=batch_stats)
+
+            try:
+                # Submissão PACEADA com colheita INTERCALADA: o token bucket
+                # continua ditando o ritmo global de envio, mas a cada tique
+                # também colhemos os futures já concluídos. Assim o flush
+                # periódico e o fail-fast dos workers (sys.exit na
+                # persistência de etapa 1, repropagado pelo .result()) agem
+                # DURANTE o lote, e não só depois da última submissão.
+                envios: List[Future] = []
+                concluidos = 0
+
+                def colher_envios(bloquear: bool = False) -> None:
+                    nonlocal concluidos
+                    em_voo: List[Future] = []
+                    for future in envios:
+                        if not bloquear and not future.done():
+                            em_voo.append(future)
+                            continue
+                        sheets_future = future.result()
+                        if sheets_future is not None:
+                            pending_sheets.append(sheets_future)
+                        concluidos += 1
+                        # Commits (Etapa 2) vão ao disco a cada
+                        # ENVIADOS_FLUSH_INTERVAL conclusões; o flush final
+                        # no finally cobre o resto do lote
+                        if concluidos % ENVIADOS_FLUSH_INTERVAL == 0:
+                            drain_sheets()
+                            with _registros_lock:
+                                save_enviados_atomically(registros)
+                            flush_log()
+                    envios[:] = em_voo
+
+                for eleitor in targets:
+                    if batch_stats.should_abort():
+                        abort_msg = (f"{batch_stats.failures} falhas em {batch_stats.attempts} envios (>= 1/3): "
+                                     "interrompendo o lote — o provedor está rejeitando as mensagens.")
+                        print(f"[ABORT LOTE] {abort_msg}")
+                        log_event(
+                            level="ERRO CRÍTICO",
+                            email="",
+                            user_id="SYSTEM",
+                            message=f"ABORT LOTE: {abort_msg}",
+                            is_production=args.production
+                        )
+                        break
+                    rate_limiter.acquire()
+                    envios.append(smtp_pool.submit(enviar_eleitor, eleitor))
+                    colher_envios()
+
+                # Cauda do lote: espera os envios ainda em voo mantendo a
+                # mesma cadência de flush
+                colher_envios(bloquear=True)
+            finally:
+                smtp_pool.shutdown(wait=True)
+                drain_sheets()
+                sheets_pool.shutdown(wait=True)
+                for session in smtp_sessions:
+                    session.close()
+                # Flush final: persiste os commits diferidos do lote
+                try:
+                    with _registros_lock:
+                        save_enviados_atomically(registros)
+                except Exception as e:
+                    print(f"[ERRO] Falha no flush final do CSV de enviados: {e}")
+                flush_log()
 
             # 5. Atualização da flag de apuração (run once)
             if len(targets) > 0:
-                timestamp = datetime.now().strftime(DATE_FORMAT)
+                timestamp = current_timestamp()
                 range_a1_notation = f"{APPS_SCRIPT_FLAG_CELL}"
                 sheet_service.update_cell(range_a1_notation, timestamp)
                 
@@ -1253,7 +2153,7 @@ def main():
     finally:
         if tee_output:
             # Escreve um separador claro no arquivo ANTES de restaurar o stdout
-            tee_output.write(f"\n[{datetime.now().strftime(DATE_FORMAT)}] <<< FIM DA EXECUÇÃO >>>\n\n")
+            tee_output.write(f"\n[{current_timestamp()}] <<< FIM DA EXECUÇÃO >>>\n\n")
 
             # 1. Restaura o sys.stdout original
             sys.stdout = tee_output.stdout 